@@ -1,12 +1,13 @@
 import time
 import numpy as np
 from pyscf import ao2mo
+from pyscf.lib import logger
 from pyscf.lib import current_memory, numpy_helper
 from pyscf.mcscf.mc1step import gen_g_hop
 from mrh.util.basis import represent_operator_in_basis, is_basis_orthonormal, measure_basis_olap
-from mrh.util.basis import orthonormalize_a_basis, get_complementary_states, get_overlapping_states
-from mrh.util.basis import is_basis_orthonormal_and_complete
+from mrh.util.basis import orthonormalize_a_basis, get_overlapping_states
 from mrh.util.rdm import get_2CDM_from_2RDM
+from mrh.util import params
 from mrh.my_pyscf.df.sparse_df import sparsedf_array
 from scipy import linalg
 from itertools import product
@@ -18,6 +19,38 @@ matrix separately and you must do the "fake" semi-cumulant decomposition
 without the spin-density terms! For now fix this by setting dm1s = [dm1/2, dm1/2] and focka = fockb
 = fock. '''
 
+_einsum_paths = {}
+def _einsum (subscripts, *operands):
+    ''' np.einsum with optimize='optimal', remembering the contraction path found for each
+    combination of subscripts and operand shapes so that repeat calls skip the path search '''
+    key = (subscripts,) + tuple (o.shape for o in operands)
+    path = _einsum_paths.get (key, None)
+    if path is None:
+        path = _einsum_paths[key] = np.einsum_path (subscripts, *operands, optimize='optimal')[0]
+    return np.einsum (subscripts, *operands, optimize=path)
+
+def _sandwich (l, m, r):
+    ''' l @ m[i] @ r for a stack of matrices m. For real data, goes straight to BLAS dgemm with
+    one preallocated intermediate; the transposed products r.T @ m[i].T @ l.T are formed so that
+    C-ordered inputs and outputs are handed to Fortran without copies. '''
+    m = np.asarray (m)
+    if any (np.iscomplexobj (x) for x in (l, m, r)): return l @ m @ r
+    l, m, r = (np.ascontiguousarray (x, dtype=np.float64) for x in (l, m, r))
+    out = np.empty ((m.shape[0], l.shape[0], r.shape[1]))
+    tmpT = np.empty ((r.shape[1], m.shape[1]), order='F')
+    for mi, oi in zip (m, out):
+        linalg.blas.dgemm (1.0, r.T, mi.T, c=tmpT, overwrite_c=True) # (m @ r).T
+        linalg.blas.dgemm (1.0, tmpT, l.T, c=oi.T, overwrite_c=True) # (l @ m @ r).T
+    return out
+
+def _is_negligible (x, thresh=1e-8):
+    ''' Screening test for overlap and density blocks: True if x is empty or its Frobenius norm is
+    below thresh. x is raveled (a view if x is contiguous) because scipy's norm only uses BLAS nrm2
+    on 1-D arrays, which streams through x once instead of allocating abs (x); since the norm
+    bounds the largest element from above, it never screens out more than a max-abs test.
+    '''
+    return (not x.size) or linalg.norm (x.ravel (), check_finite=False) < thresh
+
 class HessianCalculator (object):
     ''' Calculate elements of an orbital-rotation Hessian corresponding to particular orbital
     ranges in a CASSCF or LASSCF wave function. This is not designed to be efficient in orbital
@@ -42,6 +75,7 @@ class HessianCalculator (object):
                     molecular orbital coefficients for the active space(s)
         '''
         self.scf = mf
+        self.verbose = getattr (mf, 'verbose', 0)
         self.oneRDMs = np.asarray (oneRDMs)
         #if self.oneRDMs.ndim == 3: #== 2:
         #    dm = sum (self.oneRDMs) / 2
@@ -66,6 +100,7 @@ class HessianCalculator (object):
             self.twoCDM = [twoCDM]
         self.nas = len (self.twoCDM)
         self.ncas = [t.shape[0] for t in self.twoCDM]
+        self.twoCDM_sym = [t + t.transpose (0,1,3,2) for t in self.twoCDM]
  
         if isinstance (ao2amo, (list,tuple,)):
             self.mo2amo = ao2amo
@@ -75,6 +110,7 @@ class HessianCalculator (object):
             self.mo2amo = [ao2amo]
         self.mo2amo = [self.moHS @ ao2a for ao2a in self.mo2amo]
         assert (len (self.mo2amo) == self.nas), "Same number of mo2amo's and twoCDM's required"
+        self._stack_mo2amo ()
 
         # Precalculate (full,a|a,a) for fast gradients
         self.faaa = []
@@ -88,11 +124,13 @@ class HessianCalculator (object):
         # Precalculate the fock matrix 
         vj, vk = self.scf.get_jk (dm=self.oneRDMs)
         fock = self.scf.get_hcore () + vj[0] + vj[1]
-        self.fock = [fock - vk[0], fock - vk[1]]
+        fock = fock[None,:,:] - np.asarray (vk)
 
-        # Put 1rdm and fock in the orthonormal basis
-        self.fock = [moH @ f @ mo for f in self.fock]
-        self.oneRDMs = [moHS @ D @ Smo for D in self.oneRDMs]
+        # Put 1rdm and fock in the orthonormal basis (batched over spin)
+        self.fock_arr = _sandwich (moH, fock, mo)
+        self.oneRDMs_arr = _sandwich (moHS, self.oneRDMs, Smo)
+        self.fock = list (self.fock_arr)
+        self.oneRDMs = list (self.oneRDMs_arr)
 
     def __call__(self, *args, **kwargs):
         if len (args) == 0:
@@ -136,7 +174,10 @@ class HessianCalculator (object):
     def _call_general (self, p, q, r, s):
         ''' The Hessian E2^pr_qs is F2^pr_qs - F2^qr_ps - F2^ps_qr + F2^qs_pr. 
         Since the orbitals are segmented into separate ranges, you can't necessarily just calculate
-        one of these and transpose. '''
+        one of these and transpose. If p and q span the same space, and so do r and s, F2 is
+        calculated once in those spaces, where the permutations are just transposes, and the
+        result is projected onto p, q, r, s at the end. Otherwise (e.g., disjoint ranges such as
+        ui and ai), working in the unions would cost far more than the four separate blocks. '''
         norb = [p.shape[-1], q.shape[-1], r.shape[-1], s.shape[-1]]
         if 0 in norb: return np.zeros (norb)
         # Put the orbital ranges in the orthonormal basis for fun and profit
@@ -144,13 +185,33 @@ class HessianCalculator (object):
         q = self.moHS @ q
         r = self.moHS @ r
         s = self.moHS @ s
-        eris = HessianERITransformer (self, p, q, r, s)
-        hess  = self._get_Fock2 (p, q, r, s, eris)
-        hess -= self._get_Fock2 (q, p, r, s, eris).transpose (1,0,2,3)
-        hess -= self._get_Fock2 (p, q, s, r, eris).transpose (0,1,3,2)
-        hess += self._get_Fock2 (q, p, s, r, eris).transpose (1,0,3,2)
+        u, (u2p, u2q) = self._get_collective_basis (p, q)
+        v, (v2r, v2s) = self._get_collective_basis (r, s)
+        if not (u.shape[1] == norb[0] == norb[1] and v.shape[1] == norb[2] == norb[3]):
+            eris = HessianERITransformer (self, p, q, r, s)
+            hess  = self._get_Fock2 (p, q, r, s, eris)
+            hess -= self._get_Fock2 (q, p, r, s, eris).transpose (1,0,2,3)
+            hess -= self._get_Fock2 (p, q, s, r, eris).transpose (0,1,3,2)
+            hess += self._get_Fock2 (q, p, s, r, eris).transpose (1,0,3,2)
+            return hess / 2
+        eris = HessianERITransformer (self, u, u, v, v)
+        hess  = self._get_Fock2 (u, u, v, v, eris)
+        hess -= hess.transpose (1,0,2,3)
+        hess -= hess.transpose (0,1,3,2)
+        hess = np.tensordot (u2p.conjugate (), hess, axes=((0),(0))) # 'ap,abcd->pbcd'
+        hess = np.tensordot (hess, u2q.conjugate (), axes=((1),(0))) # 'pbcd,bq->pcdq'
+        hess = np.tensordot (hess, v2r, axes=((1),(0))) # 'pcdq,cr->pdqr'
+        hess = np.tensordot (hess, v2s, axes=((1),(0))) # 'pdqr,ds->pqrs'
         return hess / 2
 
+    def _stack_mo2amo (self):
+        ''' Stack all active spaces into one array, so that overlaps with the active orbitals can
+        be computed with one matrix multiplication and sliced per active space '''
+        self.mo2amo_stacked = np.concatenate (self.mo2amo, axis=1)
+        self.mo2amo_stacked_H = self.mo2amo_stacked.conjugate ().T.copy ()
+        offs = np.cumsum ([0] + list (self.ncas))
+        self.amo_slices = [slice (i, j) for i, j in zip (offs[:-1], offs[1:])]
+
     def _get_eri (self, orbs_list, compact=False):
         if isinstance (orbs_list, np.ndarray) and orbs_list.ndim == 2:
             orbs_list = [orbs_list, orbs_list, orbs_list, orbs_list]
@@ -168,15 +229,24 @@ class HessianCalculator (object):
         return eri
 
     def _get_collective_basis (self, *args):
-        p = np.concatenate (args, axis=-1)
-        try: # Linear algebra problem sometimes if one of the arguments is a complete basis?
-             # Can I exception-handle my way out of this?
-            q = orthonormalize_a_basis (p)
-        except np.linalg.LinAlgError as e:
-            q = None
-            for r in args:
-                if is_basis_orthonormal_and_complete (r): q = r
-            if q is None: raise (e)
+        ''' Orthonormal basis for the union of the ranges in args, built by incremental
+        Gram-Schmidt: each range in turn has the accumulated basis projected out of it (twice, for
+        numerical stability), and a rank-revealing QR of the residual supplies the new vectors.
+        Ranges that overlap heavily with what came before therefore cost very little. '''
+        nmo = args[0].shape[0]
+        dtype = np.result_type (*args)
+        q = np.zeros ((nmo, 0), dtype=dtype)
+        for arg in args:
+            if q.shape[1] == nmo: break
+            if arg.shape[1] == 0: continue
+            qH = q.conjugate ().T
+            resid = arg - q @ (qH @ arg)
+            resid -= q @ (qH @ resid)
+            Q, R = linalg.qr (resid, mode='economic', pivoting=True)[:2]
+            # Same linear-dependence cutoff as orthonormalize_a_basis, which tests eigenvalues
+            # of the overlap matrix, i.e., squared singular values
+            rank = np.count_nonzero (np.abs (np.diag (R))**2 > params.num_zero_ltol)
+            q = np.append (q, Q[:,:rank], axis=1)
         qH = q.conjugate ().T
         q2p = [qH @ arg for arg in args]
         return q, q2p
@@ -185,30 +255,29 @@ class HessianCalculator (object):
         ''' This calculates one of the terms F2^pr_qs '''
 
         # Easiest term: 2 f^p_r D^q_s
-        f_pr = [p.conjugate ().T @ f @ r for f in self.fock]
-        D_qs = [q.conjugate ().T @ D @ s for D in self.oneRDMs]
-        hess = 2 * sum ([np.multiply.outer (f, D) for f, D in zip (f_pr, D_qs)])
-        hess = hess.transpose (0,2,1,3) # 'pr,qs->pqrs'
+        pH, qH = p.conjugate ().T, q.conjugate ().T
+        f_pr = pH @ self.fock_arr @ r
+        D_qs = qH @ self.oneRDMs_arr @ s
+        hess = 2 * np.einsum ('xpr,xqs->pqrs', f_pr, D_qs)
 
         # Generalized Fock matrix terms: delta_qr (F^p_s + F^s_p)
-        ovlp_qr = q.conjugate ().T @ r
-        if np.amax (np.abs (ovlp_qr)) > 1e-8: # skip if there is no ovlp between the q and r ranges
+        ovlp_qr = qH @ r
+        if not _is_negligible (ovlp_qr): # skip if there is no ovlp between the q and r ranges
             gf_ps = self._get_Fock1 (p, s) + self._get_Fock1 (s, p).T
-            hess += np.multiply.outer (ovlp_qr, gf_ps).transpose (2,0,1,3) # 'qr,ps->pqrs'
+            hess += np.einsum ('qr,ps->pqrs', ovlp_qr, gf_ps)
 
         # Explicit CDM contributions:  2 v^pu_rv l^qu_sv  +  2 v^pr_uv (l^qs_uv + l^qv_us)        
-        t0, w0 = time.process_time (), time.time ()
-        for t, a, n in zip (self.twoCDM, self.mo2amo, self.ncas):
-            a2q = a.conjugate ().T @ q
-            a2s = a.conjugate ().T @ s
+        A2q = self.mo2amo_stacked_H @ q
+        A2s = self.mo2amo_stacked_H @ s
+        for t, t_sym, a, n, sl in zip (self.twoCDM, self.twoCDM_sym, self.mo2amo, self.ncas,
+                                       self.amo_slices):
+            a2q, a2s = A2q[sl], A2s[sl]
             # If either q or s has no weight on the current active space, skip
-            if np.amax (np.abs (a2q)) < 1e-8 or np.amax (np.abs (a2s)) < 1e-8:
+            if _is_negligible (a2q) or _is_negligible (a2s):
                 continue
-            thess  = np.tensordot (eris (p,r,a,a), t, axes=((2,3),(2,3)))
-            thess += np.tensordot (eris (p,a,r,a), t + t.transpose (0,1,3,2), axes=((1,3),(1,3)))
-            thess = np.tensordot (thess, a2q, axes=(2,0)) # 'prab,aq->prbq'
-            thess = np.tensordot (thess, a2s, axes=(2,0)) # 'prbq,bs->prqs'
-            hess += 2 * thess.transpose (0, 2, 1, 3) # 'prqs->pqrs'
+            thess  = _einsum ('prcd,abcd,aq,bs->pqrs', eris (p,r,a,a), t, a2q, a2s)
+            thess += _einsum ('pcrd,acbd,aq,bs->pqrs', eris (p,a,r,a), t_sym, a2q, a2s)
+            hess += 2 * thess
 
         # Weirdo split-coulomb and split-exchange terms
         # u,v are supersets of q,s 
@@ -221,13 +290,14 @@ class HessianCalculator (object):
 
     def _get_Fock1 (self, p, q):
         ''' Calculate the "generalized fock matrix" for orbital ranges p and q '''
-        gfock = sum ([f @ D for f, D in zip (self.fock, self.oneRDMs)])
-        gfock = p.conjugate ().T @ gfock @ q
+        gfock = np.einsum ('sij,sjk->ik', self.fock_arr, self.oneRDMs_arr, optimize=True)
         pH = p.conjugate ().T
-        for t, a, n, faaa in zip (self.twoCDM, self.mo2amo, self.ncas, self.faaa):
-            a2q = a.conjugate ().T @ q
+        gfock = pH @ gfock @ q
+        A2q = self.mo2amo_stacked_H @ q
+        for t, sl, n, faaa in zip (self.twoCDM, self.amo_slices, self.ncas, self.faaa):
+            a2q = A2q[sl]
             # If q has no weight on the current active space, skip
-            if (not a2q.size) or np.amax (np.abs (a2q)) < 1e-8:
+            if _is_negligible (a2q):
                 continue
             eri = np.tensordot (pH, faaa, axes=1)
             gfock += np.tensordot (eri, t, axes=((1,2,3),(1,2,3))) @ a2q
@@ -239,11 +309,8 @@ class HessianCalculator (object):
         if u.shape[1] == 0 or v.shape[1] == 0: return 0
         D_uq = u.conjugate ().T @ dm @ q
         D_vs = v.conjugate ().T @ dm @ s
-        if np.amax (np.abs (D_uq)) < 1e-8 or np.amax (np.abs (D_vs)) < 1e-8: return 0
-        hess = eris (p,u,r,v)
-        hess = np.tensordot (hess, D_uq, axes=(1,0)) # 'purv,uq->prvq'
-        hess = np.tensordot (hess, D_vs, axes=(2,0)) # 'prvq,vs->prqs'
-        return hess.transpose (0,2,1,3) # 'prqs->pqrs'
+        if _is_negligible (D_uq) or _is_negligible (D_vs): return 0
+        return eris (p,u,r,v, coeffs=[None,D_uq,None,D_vs]) # 'purv,uq,vs->pqrs'
 
     def _get_splitx (self, p, q, r, s, dm, u, v, eris): #perm_pq, perm_rs):
         ''' (v^pv_ru + v^pr_vu) g^q_u g^s_v = v^pr_vu g^q_u g^s_v - v^pv_su g^q_u g^r_v
@@ -256,26 +323,32 @@ class HessianCalculator (object):
         if u.shape[1] == 0 or v.shape[1] == 0: return 0
         D_uq = u.conjugate ().T @ dm @ q
         D_vs = v.conjugate ().T @ dm @ s
-        if np.amax (np.abs (D_uq)) < 1e-8 or np.amax (np.abs (D_vs)) < 1e-8: return 0
-        hess = eris (p,r,v,u) + eris (p,v,r,u).transpose (0,2,1,3)
-        hess = np.tensordot (hess, D_uq, axes=(3,0)) # 'prvu,uq->prvq'
-        hess = np.tensordot (hess, D_vs, axes=(2,0)) # 'prvq,vs->prqs'
-        return hess.transpose (0,2,1,3) # 'prqs->pqrs'
+        if _is_negligible (D_uq) or _is_negligible (D_vs): return 0
+        hess  = eris (p,r,v,u, coeffs=[None,None,D_vs,D_uq]).transpose (0,3,1,2) # 'prsq->pqrs'
+        hess += eris (p,v,r,u, coeffs=[None,D_vs,None,D_uq]).transpose (0,3,2,1) # 'psrq->pqrs'
+        return hess
 
     def _append_entangled (self, p):
         ''' Do SVD of 1-rdms to get a small number of orbitals that you need to actually pay
         attention to when computing splitc and splitx eris. Append these extras to the end of p '''
-        q = get_complementary_states (p)
-        if 0 in q.shape: return p
-        qH = q.conjugate ().T
+        if 0 in p.shape: return p
+        p_on = orthonormalize_a_basis (p)
+        p_onH = p_on.conjugate ().T
         lvecs = []
         for dm in self.oneRDMs + [sum (self.oneRDMs)]:
-            lvec, sigma, rvec = linalg.svd (qH @ dm @ p, full_matrices=False)
-            idx = np.abs (sigma) > 1e-8
-            if np.count_nonzero (idx): lvecs.append (lvec[:,idx])
+            # Project p out of dm @ p directly, rather than building the whole complement of p
+            # and then discarding most of it. The residual has many more rows than columns, so
+            # get its left singular vectors from the eigenvectors of its small Gram matrix.
+            # The Gram eigenvalues are only good to ~eps * |resid|^2, so take the singular values
+            # from the norms of resid @ rvec instead before thresholding them.
+            dmp = dm @ p
+            resid = dmp - p_on @ (p_onH @ dmp)
+            lvec = resid @ linalg.eigh (resid.conjugate ().T @ resid)[1]
+            sigma = linalg.norm (lvec, axis=0)
+            idx = sigma > 1e-8
+            if np.count_nonzero (idx): lvecs.append (lvec[:,idx] / sigma[idx])
         if len (lvecs):
-            lvec = self._get_collective_basis (*lvecs)[0]
-            u = q @ lvec
+            u = self._get_collective_basis (*lvecs)[0]
             return np.append (p, u, axis=1)
         return p
 
@@ -317,10 +390,11 @@ class HessianCalculator (object):
         ''' OLD CODE, NOT USED '''
         ''' Obtain the gradient for ranges p->q after making approx gradient-descent step in r->s:
         E1'^p_q = E1^p_q - E2^pr_qs * x^r_s = E1^p_q + E2^pr_qs * E1^r_s / E2^rr_ss '''
-        t0, w0 = time.process_time (), time.time ()
+        t0, w0 = time.process_time (), time.perf_counter ()
         r, x_rs, s = self.get_diagonal_step (r, s)
-        print ("Time to get diagonal step: {:.3f} s clock, {:.3f} wall".format (
-            time.process_time () - t0, time.time () - w0))
+        if self.verbose >= logger.DEBUG:
+            print ("Time to get diagonal step: {:.3f} s clock, {:.3f} wall".format (
+                time.process_time () - t0, time.perf_counter () - w0))
         e1 = np.zeros ((self.nao,self.nao), dtype=np.float64)
         for p, q in pq_pairs:
             qH = q.conjugate ().T
@@ -480,6 +554,7 @@ class LASSCFHessianCalculator (HessianCalculator):
 
     def __init__(self, ints, oneRDM_loc, all_frags, fock_c, fock_s, Hop_noxc=False):
         self.ints = ints
+        self.verbose = ints.mol.verbose
         self.Hop_noxc = Hop_noxc
         active_frags = [f for f in all_frags if f.norbs_as]
 
@@ -494,12 +569,15 @@ class LASSCFHessianCalculator (HessianCalculator):
         #print ("Error: {} charge; {} spin".format (linalg.norm (fock_c - fock_c_check),
         #                                           linalg.norm (fock_s - fock_s_check)))
         self.fock = [fock_c + fock_s, fock_c - fock_s]
+        self.fock_arr = np.asarray (self.fock)
+        self.oneRDMs_arr = np.asarray (self.oneRDMs)
 
         # Fragment things
         self.mo2amo = [f.loc2amo for f in active_frags]
         self.twoCDM = [f.twoCDMimp_amo for f in active_frags]
         self.ncas = [f.norbs_as for f in active_frags]
         self.faaa = [f.eri_gradient for f in active_frags]
+        self._stack_mo2amo ()
 
         # Fix cumulant decomposition
         for ix, (mo, dm2, ncas) in enumerate (zip (self.mo2amo, self.twoCDM, self.ncas)):
@@ -510,6 +588,7 @@ class LASSCFHessianCalculator (HessianCalculator):
             correction -= np.multiply.outer (dm1, dm1) / 2
             dm2 = dm2 + correction.transpose (0,3,2,1)
             self.twoCDM[ix] = dm2
+        self.twoCDM_sym = [t + t.transpose (0,1,3,2) for t in self.twoCDM]
 
     def _get_eri (self, orbs_list, compact=False):
         return self.ints.general_tei (orbs_list, compact=compact)
@@ -577,26 +656,54 @@ class HessianERITransformer (object):
             so p appears only once and s appears three times. Given permutation symmetries
             (wx|yz) = (yz|wx) = (xw|yz) = (wx|zy), I can generate all the eris I need for the
             Hessian calculation from this cache. Since this calls _get_eri, it will also
-            automatically take advantage of _eri_kernel if it's available.
+            automatically take advantage of _eri_kernel if it's available. If w, x, y, z all
+            span the same space (e.g., in _call_fullrange), they are all set to w and the eris
+            are fetched compactly with pair permutation symmetry, so that the AO-to-MO transform
+            only computes unique pairs. They are unpacked on the first call to _grind, so the
+            array held for the contraction is not any smaller.
+            Ranges passed more than once (e.g., (u,u,v,v) from _call_general) are only entangled
+            and orthonormalized once, and bases with the same set of unique ranges (e.g., x and z
+            if q is r) are only computed once.
         '''
-        p,q,r,s = (parent._append_entangled (z) for z in (p,q,r,s))
-        a = np.concatenate (parent.mo2amo, axis=1)
-        self.w = w = parent._get_collective_basis (a, p)[0]
-        self.x = x = parent._get_collective_basis (a, s, r, q)[0] 
-        self.y = y = parent._get_collective_basis (a, s, r)[0]
-        self.z = z = parent._get_collective_basis (a, s, q)[0]
-        self._eri = parent._get_eri ([w,x,y,z])
+        entangled = {}
+        for t in (p,q,r,s):
+            if id (t) not in entangled: entangled[id (t)] = parent._append_entangled (t)
+        p,q,r,s = (entangled[id (t)] for t in (p,q,r,s))
+        a = parent.mo2amo_stacked
+        bases = {}
+        def get_basis (*args):
+            uniq = []
+            for arg in args:
+                if not any (arg is u for u in uniq): uniq.append (arg)
+            key = frozenset (id (u) for u in uniq)
+            if key not in bases: bases[key] = parent._get_collective_basis (*uniq)[0]
+            return bases[key]
+        self.w = w = get_basis (a, p)
+        self.x = x = get_basis (a, s, r, q)
+        self.y = y = get_basis (a, s, r)
+        self.z = z = get_basis (a, s, q)
+        self.compact = all ((b.shape == w.shape) and self.p_in_c (w, b) for b in (x, y, z))
+        if self.compact: self.x = x = self.y = y = self.z = z = w
+        self._eri = parent._get_eri ([w,x,y,z], compact=self.compact)
         return
 
-    def __call__(self, p, q, r, s, _first_call=True):
+    def __call__(self, p, q, r, s, coeffs=None, _first_call=True):
         ''' Because of several necessary index permutations, I cannot know in advance which of
         w,x,y,z encloses each of p, q, r, s, but I should have prepared it so that any call I make
         can be carried out. yz is the more restrictive pair in my cache, so first see if r, s is in
-        yz and if not, flip pq<->rs. wx contains all pairs that I should ever need so. ''' 
+        yz and if not, flip pq<->rs. wx contains all pairs that I should ever need so. 
+
+        coeffs, if provided, is a list of four matrices (or Nones) to contract onto the four
+        indices once they are placed, so that for instance
+            eris (p,u,r,v, coeffs=[None,D_uq,None,D_vs]) = 'purv,uq,vs->pqrs'
+        without ever building the (possibly much larger) (pu|rv) array. ''' 
+        if coeffs is None: coeffs = [None,]*4
         rs_yz, rs_correct = self.pq_in_cd (self.y, self.z, r, s)
         pq_wx, pq_correct = self.pq_in_cd (self.w, self.x, p, q)
         if _first_call and (not (pq_wx and rs_yz)):
-            return self.__call__(r, s, p, q, _first_call=False).transpose (2, 3, 0, 1)
+            coeffs = [coeffs[i] for i in (2,3,0,1)]
+            return self.__call__(r, s, p, q, coeffs=coeffs, _first_call=False).transpose (
+                2, 3, 0, 1)
         try:
             assert (pq_wx and rs_yz), "Can't place orbital sets in this eri array"
         except AssertionError as e:
@@ -616,25 +723,32 @@ class HessianERITransformer (object):
             print ("Is z orthonormal? {}".format (linalg.eigh (self.z.conjugate ().T @ self.z)[0]))
             raise (e)
         # Permute the order of the pairs individually
-        if pq_correct and rs_correct: return self._grind (p, q, r, s)
-        elif pq_correct: return self._grind (p, q, s, r).transpose (0, 1, 3, 2)
-        elif rs_correct: return self._grind (q, p, r, s).transpose (1, 0, 2, 3)
-        else: return self._grind (q, p, s, r).transpose (1, 0, 3, 2)
-
-    def _grind (self, p, q, r, s):
+        c = coeffs
+        if pq_correct and rs_correct: return self._grind (p, q, r, s, c)
+        elif pq_correct: return self._grind (p, q, s, r, [c[0],c[1],c[3],c[2]]).transpose (
+            0, 1, 3, 2)
+        elif rs_correct: return self._grind (q, p, r, s, [c[1],c[0],c[2],c[3]]).transpose (
+            1, 0, 2, 3)
+        else: return self._grind (q, p, s, r, [c[1],c[0],c[3],c[2]]).transpose (1, 0, 3, 2)
+
+    def _grind (self, p, q, r, s, coeffs=None):
         assert (self.p_in_c (self.w, p)), 'p not in w after permuting!'
         assert (self.p_in_c (self.x, q)), 'q not in x after permuting!'
         assert (self.p_in_c (self.y, r)), 'r not in y after permuting!'
         assert (self.p_in_c (self.z, s)), 's not in z after permuting!'
+        if coeffs is None: coeffs = [None,]*4
+        q, r, s = (t if c is None else t @ c for t, c in zip ((q, r, s), coeffs[1:]))
         p2w = p.conjugate ().T @ self.w
+        # Index 0 is conjugated, so its coeff is applied after the conjugation, not folded into p
+        if coeffs[0] is not None: p2w = coeffs[0].T @ p2w
         x2q = self.x.conjugate ().T @ q
         y2r = self.y.conjugate ().T @ r
         z2s = self.z.conjugate ().T @ s
-        pqrs = np.tensordot (p2w, self._eri, axes=1)
-        pqrs = np.tensordot (pqrs, x2q, axes=((1),(0)))
-        pqrs = np.tensordot (pqrs, y2r, axes=((1),(0)))
-        pqrs = np.tensordot (pqrs, z2s, axes=((1),(0)))
-        return pqrs
+        if self.compact: # Unpack on first use only, and drop the packed copy
+            self._eri = ao2mo.restore (1, self._eri, self.w.shape[1])
+            self.compact = False
+        # The best order in which to contract the four indices depends on the range sizes
+        return _einsum ('wxyz,pw,xq,yr,zs->pqrs', self._eri, p2w, x2q, y2r, z2s)
 
     def p_in_c (self, c, p, _return_numbers=False):
         ''' Return c == complete basis for p '''
@@ -657,7 +771,7 @@ class HessianOperator (HessianCalculator):
         self.s = s
         rH = self.r.conjugate ().T
         sH = self.s.conjugate ().T
-        a = np.concatenate (self.mo2amo, axis=-1)
+        a = self.mo2amo_stacked
         do_r = sum (abs (linalg.svd (sH @ a)[1])) > 1e-8
         do_s = sum (abs (linalg.svd (rH @ a)[1])) > 1e-8
         if do_r and do_s: self.k = k = self._get_collective_basis (self.r, self.s)[0]
@@ -2,72 +2,98 @@ import os
 import numpy as np
 from scipy import linalg
 from pyscf import lib
-from pyscf.lo import orth
 from pyscf.scf.rohf import get_roothaan_fock
 from mrh.my_pyscf.mcscf import lasci, _DFLASCI
 
 # TODO: symmetry
-def orth_orb (las, kf2_list):
+def orth_orb (las, kf2_list, s0=None):
     ncore, ncas = las.ncore, las.ncas
     nocc = ncore + ncas
     nao, nmo = las.mo_coeff.shape
     nfrags = len (kf2_list)
     log = lib.logger.new_logger (las, las.verbose)
+    frag_bounds = np.cumsum ([0,] + list (las.ncas_sub))
 
     # orthonormalize active orbitals
     mo_cas = np.empty ((nao, ncas), dtype=las.mo_coeff.dtype)
     ci = []
     for ifrag, kf2 in enumerate (kf2_list):
-        i = sum (las.ncas_sub[:ifrag])
-        j = i + las.ncas_sub[ifrag]
+        i, j = frag_bounds[ifrag:ifrag+2]
         k, l = i + ncore, j + ncore
         mo_cas[:,i:j] = kf2.mo_coeff[:,k:l]
         ci.append (kf2.ci[ifrag])
     mo_cas_preorth = mo_cas.copy ()
-    s0 = las._scf.get_ovlp ()
-    mo_cas = orth.vec_lowdin (mo_cas_preorth, s=s0)
+    if s0 is None: s0 = las._scf.get_ovlp ()
+    # Symmetric (Lowdin) orthogonalization, as in pyscf.lo.orth.vec_lowdin, but keeping S C
+    # and C^H S C around
+    smo0 = s0 @ mo_cas_preorth
+    ovlp = mo_cas_preorth.conj ().T @ smo0
+    w, v = linalg.eigh (ovlp, check_finite=False)
+    v = v[:,w>1e-15]
+    w = w[w>1e-15]
+    lowdin = (v / np.sqrt (w)) @ v.conj ().T
     
-    # reassign orthonormalized active orbitals
-    proj = []
-    for ifrag in range (nfrags):
-        i = sum (las.ncas_sub[:ifrag])
-        j = i + las.ncas_sub[ifrag]
-        proj.append (mo_cas_preorth[:,i:j] @ mo_cas_preorth[:,i:j].conj ().T)
-    smo1 = s0 @ mo_cas
-    frag_weights = np.stack ([((p @ smo1) * smo1.conjugate ()).sum (0)
-                              for p in proj], axis=-1)
-    idx = np.argsort (frag_weights, axis=1)[:,-1]
-    mo_las = []
+    # reassign orthonormalized active orbitals. Everything here is done in the basis of
+    # mo_cas_preorth (C), in which the orthonormalized orbitals are the columns of lowdin.
+    # The weight of fragment ifrag's projector P = C C^H on orthonormalized orbital a is
+    # <a|S P S|a> = sum_(k in ifrag) |x[k,a]|^2, x = C^H S C lowdin, so a segmented sum does it
+    # without ever forming the (nao,nao) projectors.
+    x = ovlp @ lowdin
+    frag_weights = np.add.reduceat ((x * x.conj ()).real, frag_bounds[:-1], axis=0)
+    idx = np.argsort (frag_weights, axis=0)[-1]
+    # Only the polar factor u @ vh of each fragment's s1 is needed. When s1 is well-conditioned,
+    # as it normally is, get it from the eigendecomposition of s1^H s1 instead of an SVD:
+    # s1 @ (s1^H s1)^(-1/2) = u @ vh. Pad the fragment blocks with the identity so that all of
+    # them go through one batched eigh; the padding is its own polar factor and drops out.
+    nmax = max (las.ncas_sub)
+    mos = []
+    s1 = np.tile (np.eye (nmax, dtype=lowdin.dtype), (nfrags, 1, 1))
     for ifrag in range (nfrags):
-        mo = mo_cas[:,(idx == ifrag)]
-        i = sum (las.ncas_sub[:ifrag])
-        j = i + las.ncas_sub[ifrag]
-        s1 = mo.conj ().T @ s0 @ mo_cas_preorth[:,i:j]
-        u, svals, vh = linalg.svd (s1)
-        mo_las.append (mo @ u @ vh)
-    mo_cas = np.concatenate (mo_las, axis=1)
+        sel = (idx == ifrag)
+        mos.append (lowdin[:,sel])
+        i, j = frag_bounds[ifrag:ifrag+2]
+        # mo^H S C[:,i:j] = (lowdin^H C^H S C)[sel,i:j] = x^H[sel,i:j]
+        s1[ifrag,:j-i,:j-i] = x[i:j,sel].conj ().T
+    w, v = np.linalg.eigh (s1.conj ().transpose (0,2,1) @ s1)
+    if np.amin (w) > 1e-4:
+        polar = s1 @ ((v / np.sqrt (w)[:,None,:]) @ v.conj ().transpose (0,2,1))
+    else:
+        u, svals, vh = np.linalg.svd (s1)
+        polar = u @ vh
+    umat = np.concatenate ([mo @ p[:mo.shape[1],:mo.shape[1]] for mo, p in zip (mos, polar)],
+                           axis=1)
+    mo_cas = mo_cas_preorth @ umat
     
     # non-active orbitals
-    ucas = las.mo_coeff.conj ().T @ s0 @ mo_cas
-    u, R = linalg.qr (ucas)
+    ucas = las.mo_coeff.conj ().T @ (smo0 @ umat)
+    u, R = linalg.qr (ucas, overwrite_a=True, check_finite=False)
     # Isn't it weird that you do Gram-Schmidt by doing QR?
     errmax = np.amax (np.abs (np.abs (R[:ncas,:ncas]) - np.eye (ncas)))
     if errmax>1e-8:
         log.warn ('Active orbital orthogonalization may have failed: %e', errmax)
     mo1 = las.mo_coeff @ u
-    errmax = np.amax (np.abs (np.abs (mo_cas.conj ().T @ s0 @ mo1[:,:ncas]) - np.eye (ncas)))
+    smo1 = s0 @ mo1
+    errmax = np.amax (np.abs (np.abs (mo_cas.conj ().T @ smo1[:,:ncas]) - np.eye (ncas)))
     if errmax>1e-8:
         log.warn ('Active orbitals leaking into non-active space: %e', errmax)
-    errmax = np.amax (np.abs ((mo1.conj ().T @ s0 @ mo1) - np.eye (mo1.shape[1])))
+    errmax = np.amax (np.abs ((mo1.conj ().T @ smo1) - np.eye (mo1.shape[1])))
     if errmax>1e-8:
         log.warn ('Non-orthogonal AOs in lasscf_async.combine.orth_orb: %e', errmax)
-    mo1 = mo1[:,ncas:]
-    veff = sum ([kf2.veff for kf2 in kf2_list]) / nfrags
-    dm1s = sum ([kf2.dm1s for dm1s in kf2_list]) / nfrags
+    veff = np.zeros_like (kf2_list[0].veff)
+    dm1s = np.zeros_like (kf2_list[0].dm1s)
+    for kf2 in kf2_list:
+        veff += kf2.veff
+        dm1s += kf2.dm1s
+    veff /= nfrags
+    dm1s /= nfrags
+    # Roothaan coupling in the orthonormal basis mo1 (which spans everything dm1s and the
+    # projectors built from it can touch), so that only the non-active block is ever built
     fock = las.get_hcore ()[None,:,:] + veff
-    fock = get_roothaan_fock (fock, dm1s, s0)
-    orbsym = None # TODO: symmetry
     fock = mo1.conj ().T @ fock @ mo1
+    dm1s = smo1.conj ().T @ dm1s @ smo1
+    fock = get_roothaan_fock (fock, dm1s, np.eye (nmo))[ncas:,ncas:]
+    mo1 = mo1[:,ncas:]
+    orbsym = None # TODO: symmetry
     ene, umat = las._eig (fock, 0, 0, orbsym)
     mo_core = mo1 @ umat[:,:ncore]
     mo_virt = mo1 @ umat[:,ncore:]
@@ -80,28 +106,20 @@ class flas_stdout_env (object):
         self.las = las
         self.flas_stdout = flas_stdout
         self.las_stdout = las.stdout
+        self.targets = [las, las._scf, las.fcisolver]
+        for fcibox in las.fciboxes:
+            self.targets.append (fcibox)
+            self.targets.extend (fcibox.fcisolvers)
+        if getattr (las, 'with_df', None):
+            self.targets.append (las.with_df)
+    def _set_stdout (self, stdout):
+        for target in self.targets: target.stdout = stdout
     def __enter__(self):
-        self.las.stdout = self.flas_stdout
-        self.las._scf.stdout = self.flas_stdout
-        self.las.fcisolver.stdout = self.flas_stdout
-        for fcibox in self.las.fciboxes:
-            fcibox.stdout = self.flas_stdout
-            for fcisolver in fcibox.fcisolvers:
-                fcisolver.stdout = self.flas_stdout
-        if getattr (self.las, 'with_df', None):
-            self.las.with_df.stdout = self.flas_stdout
+        self._set_stdout (self.flas_stdout)
     def __exit__(self, type, value, traceback):
-        self.las.stdout = self.las_stdout
-        self.las._scf.stdout = self.las_stdout
-        self.las.fcisolver.stdout = self.las_stdout
-        for fcibox in self.las.fciboxes:
-            fcibox.stdout = self.las_stdout
-            for fcisolver in fcibox.fcisolvers:
-                fcisolver.stdout = self.las_stdout
-        if getattr (self.las, 'with_df', None):
-            self.las.with_df.stdout = self.las_stdout
+        self._set_stdout (self.las_stdout)
 
-def relax (las, kf):
+def relax (las, kf, s0=None):
     log = lib.logger.new_logger (las, las.verbose)
     flas_stdout = getattr (las, '_flas_stdout', None)
     if flas_stdout is None:
@@ -122,7 +140,8 @@ def relax (las, kf):
         flas.__dict__.update (las.__dict__)
         e_tot, e_cas, ci, mo_coeff, mo_energy, h2eff_sub, veff = \
             flas.kernel (kf.mo_coeff, ci0=kf.ci)
-    ovlp = mo_coeff.conj ().T @ las._scf.get_ovlp () @ mo_coeff
+    if s0 is None: s0 = las._scf.get_ovlp ()
+    ovlp = mo_coeff.conj ().T @ s0 @ mo_coeff
     errmat = ovlp - np.eye (ovlp.shape[0])
     errmax = np.amax (np.abs (errmat))
     if errmax>1e-8:
@@ -130,8 +149,9 @@ def relax (las, kf):
     return las.get_keyframe (mo_coeff, ci)
 
 def combine_o0 (las, kf2_list):
-    kf1 = orth_orb (las, kf2_list)
-    kf1 = relax (las, kf1)
+    s0 = las._scf.get_ovlp ()
+    kf1 = orth_orb (las, kf2_list, s0=s0)
+    kf1 = relax (las, kf1, s0=s0)
     return kf1
 
 
@@ -1,6 +1,8 @@
 import unittest
+import numpy as np
 from pyscf import gto, scf, tools, mcscf,lib
 from mrh.my_pyscf.mcscf import lasscf_async as asyn
+from mrh.my_pyscf.mcscf.lasscf_async import combine
 from mrh.my_pyscf.mcscf import lasscf_sync_o0 as syn
 from pyscf.mcscf import avas
 
@@ -52,6 +54,30 @@ class KnownValues (unittest.TestCase):
             with self.subTest ('energy', state=i):
                 self.assertAlmostEqual (las_syn.e_states[i], las_asyn.e_states[i], 6)
 
+    def test_orth_orb_dm1s (self):
+        # Two fragments whose dm1s differ but average to kf0.dm1s should combine to the same
+        # orbitals as two copies of kf0. dm1s only enters through the Roothaan fock, so the
+        # alpha and beta veff have to differ for it to matter.
+        las = asyn.LASSCF (mf, (2,2), (2,2))
+        mo = las.set_fragments_(frag_atom_list, mo0)
+        ci = las.get_init_guess_ci (mo)
+        las.mo_coeff = mo
+        kf0 = las.get_keyframe (mo, ci)
+        nocc = las.ncore + las.ncas
+        veff = kf0.veff.copy ()
+        veff[0] += 0.05 * mo[:,:nocc] @ mo[:,:nocc].T
+        mo_open = mo[:,[0,las.ncore-1]]
+        delta = np.zeros_like (kf0.dm1s)
+        delta[0] = mo_open @ mo_open.T
+        def get_kf (dm1s):
+            kf = las.get_keyframe (mo, ci)
+            kf._dm1s, kf._veff = dm1s, veff
+            return kf
+        kf_ref = combine.orth_orb (las, [get_kf (kf0.dm1s), get_kf (kf0.dm1s)])
+        kf_test = combine.orth_orb (las, [get_kf (kf0.dm1s+delta), get_kf (kf0.dm1s-delta)])
+        ovlp = kf_test.mo_coeff.conj ().T @ mf.get_ovlp () @ kf_ref.mo_coeff
+        self.assertAlmostEqual (np.amax (np.abs (np.abs (ovlp) - np.eye (ovlp.shape[0]))), 0, 8)
+
 if __name__ == "__main__":
     print("Full Tests for lasscf_async")
     unittest.main()
@@ -13,7 +13,7 @@ from mrh.my_pyscf.lassi.lassi import make_stdm12s, roots_make_rdm12s, ham_2q
 import itertools
 
 def setUpModule():
-    global mol1, mf1, mol2, mf2, las2, las2_e, las2_si
+    global mol1, mf1, mol2, mf2, las2, las2_e, las2_si, las2_stdm12s
     mol1 = gto.M (atom="""
         O  0.000000  0.000000  0.000000
         H  0.758602  0.000000  0.504284
@@ -48,12 +48,20 @@ def setUpModule():
     # a contaminated quasi-singlet.
     with lib.light_speed (5):
         las2_e, las2_si = las2.lassi (opt=0, soc=True, break_symmetry=True)
+    las2_stdm12s = None
 
 def tearDownModule():
-    global mol1, mf1, mol2, mf2, las2, las2_e, las2_si
+    global mol1, mf1, mol2, mf2, las2, las2_e, las2_si, las2_stdm12s
     mol1.stdout.close()
     mol2.stdout.close()
-    del mol1, mf1, mol2, mf2, las2, las2_e, las2_si
+    del mol1, mf1, mol2, mf2, las2, las2_e, las2_si, las2_stdm12s
+
+def _get_las2_stdm12s ():
+    # Shared by the slow tests, but only built if one of them actually runs
+    global las2_stdm12s
+    if las2_stdm12s is None:
+        las2_stdm12s = make_stdm12s (las2, soc=True, opt=0)
+    return las2_stdm12s
 
 class KnownValues (unittest.TestCase):
 
@@ -109,15 +117,14 @@ class KnownValues (unittest.TestCase):
             hso_test *= au2cm
             hso_test = np.around (hso_test, 8)
             # Align relative signs: 0 - 1,3,5 block (all imaginary; vide supra)
-            for i in (1,3,5):
-                if np.sign (hso_test.imag[i,0]) != np.sign (hso_ref.imag[i,0]):
-                    hso_test[i,:] *= -1
-                    hso_test[:,i] *= -1
-            # Align relative signs: 2 - 4,6 block (all real; vide supra)
-            for i in (4,6):
-                if np.sign (hso_test.real[i,2]) != np.sign (hso_ref.real[i,2]):
-                    hso_test[i,:] *= -1
-                    hso_test[:,i] *= -1
+            # and 2 - 4,6 block (all real; vide supra). No flip touches the element that decides
+            # another, so apply them all at once as a diagonal similarity transformation.
+            sgn = np.ones (7)
+            for idx, j, part in (([1,3,5], 0, 'imag'), ([4,6], 2, 'real')):
+                test = np.sign (getattr (hso_test, part)[idx,j])
+                ref = np.sign (getattr (hso_ref, part)[idx,j])
+                sgn[idx] = np.where (test != ref, -1, 1)
+            hso_test = sgn[:,None] * hso_test * sgn[None,:]
             for i, j in zip (*np.where (hso_ref)):
                 with self.subTest (tag, hso=(i,j)):
                     try:
@@ -132,13 +139,14 @@ class KnownValues (unittest.TestCase):
         stdm2 = stdm2s.sum ((1,4))
         e0eff = h0 - e0
         h0eff = np.eye (7) * e0eff
-        h1eff = lib.einsum ('pq,iqpj->ij', h1, stdm1s)
-        h2eff = lib.einsum ('pqrs,ipqrsj->ij', h2, stdm2) * .5
+        h1eff = h1.T.ravel () @ stdm1s.reshape (7, h1.size, 7) # 'pq,iqpj->ij'
+        # 'pqrs,ipqrsj->ij' as a batched GEMV over the composite pqrs index
+        h2eff = (h2.ravel () @ stdm2.reshape (7, h2.size, 7)) * .5
         test_hso (h0eff + h1eff + h2eff, 'make_stdm12s')
         rdm1s, rdm2s = roots_make_rdm12s (las, las.ci, si, soc=True, break_symmetry=True, opt=0)
         rdm2 = rdm2s.sum ((1,4))
-        e1eff = lib.einsum ('pq,iqp->i', h1, rdm1s)
-        e2eff = lib.einsum ('pqrs,ipqrs->i', h2, rdm2) * .5
+        e1eff = rdm1s.reshape (7, h1.size) @ h1.T.ravel () # 'pq,iqp->i'
+        e2eff = (rdm2.reshape (7, h2.size) @ h2.ravel ()) * .5
         test_hso ((si * (e0eff+e1eff+e2eff)[None,:]) @ si.conj ().T, 'roots_make_rdm12s')
 
     def test_soc_2frag (self):
@@ -149,7 +157,7 @@ class KnownValues (unittest.TestCase):
             self.assertAlmostEqual (lib.fp (las2_e), 154.09559506105586, 8)
 
     def test_soc_stdm12s_slow (self):
-        stdm1s_test, stdm2s_test = make_stdm12s (las2, soc=True, opt=0)    
+        stdm1s_test, stdm2s_test = _get_las2_stdm12s ()
         with self.subTest ('2-electron'):
             self.assertAlmostEqual (linalg.norm (stdm2s_test), 12.835690990485933)
         with self.subTest ('1-electron'):
@@ -159,10 +167,10 @@ class KnownValues (unittest.TestCase):
             # LAS states are spin-pure: there should be nothing in the spin-breaking sector
             self.assertAlmostEqual (np.amax(np.abs(dm1s_test[:,8:,:8])), 0)
             self.assertAlmostEqual (np.amax(np.abs(dm1s_test[:,:8,8:])), 0)
-        dm2_test = lib.einsum ('iabcdi->iabcd', stdm2s_test.sum ((1,4)))
+        dm2_test = lib.einsum ('isabtcdi->isabtcd', stdm2s_test).sum ((1,4))
         e0, h1, h2 = ham_2q (las2, las2.mo_coeff, soc=True)
-        e1 = lib.einsum ('pq,iqp->i', h1, dm1s_test)
-        e2 = lib.einsum ('pqrs,ipqrs->i', h2, dm2_test) * .5
+        e1 = dm1s_test.reshape (-1, h1.size) @ h1.T.ravel () # 'pq,iqp->i'
+        e2 = (dm2_test.reshape (-1, h2.size) @ h2.ravel ()) * .5
         e_test = e0 + e1 + e2
         with self.subTest (sanity='spin-free total energies'):
             self.assertAlmostEqual (lib.fp (e_test), lib.fp (las2.e_states), 6)
@@ -217,9 +225,14 @@ class KnownValues (unittest.TestCase):
 
     def test_soc_rdm12s_slow (self):
         rdm1s_test, rdm2s_test = roots_make_rdm12s (las2, las2.ci, las2_si, opt=0)
-        stdm1s, stdm2s = make_stdm12s (las2, soc=True, opt=0)    
-        rdm1s_ref = lib.einsum ('ir,jr,jabi->rab', las2_si.conj (), las2_si, stdm1s)
-        rdm2s_ref = lib.einsum ('ir,jr,isabtcdj->rsabtcd', las2_si.conj (), las2_si, stdm2s)
+        stdm1s, stdm2s = _get_las2_stdm12s ()
+        # 'ir,jr,...->r...' as one GEMM against the (nroots**2, nroots) matrix of si products
+        nroots = las2_si.shape[0]
+        si_ij = (las2_si.conj ()[:,None,:] * las2_si[None,:,:]).reshape (nroots*nroots, -1)
+        rdm1s_ref = stdm1s.transpose (1,2,3,0).reshape (-1, nroots*nroots) @ si_ij
+        rdm1s_ref = np.moveaxis (rdm1s_ref.reshape (*stdm1s.shape[1:3], -1), -1, 0) # 'jabi->rab'
+        rdm2s_ref = np.moveaxis (stdm2s, 0, -2).reshape (-1, nroots*nroots) @ si_ij
+        rdm2s_ref = np.moveaxis (rdm2s_ref.reshape (*stdm2s.shape[1:7], -1), -1, 0) # 'isabtcdj->rsabtcd'
         with self.subTest (sanity='dm1s'):
             self.assertAlmostEqual (lib.fp (rdm1s_test), lib.fp (rdm1s_ref), 10)
         with self.subTest (sanity='dm2s'):
@@ -237,8 +250,8 @@ class KnownValues (unittest.TestCase):
             e0, h1, h2 = ham_2q (las2, las2.mo_coeff, soc=True)
         rdm2_test = rdm2s_test.sum ((1,4))
         # NOTE: dumbass PySCF 1-RDM convention that ket is first
-        e1 = lib.einsum ('pq,iqp->i', h1, rdm1s_test)
-        e2 = lib.einsum ('pqrs,ipqrs->i', h2, rdm2_test) * .5
+        e1 = rdm1s_test.reshape (-1, h1.size) @ h1.T.ravel () # 'pq,iqp->i'
+        e2 = (rdm2_test.reshape (-1, h2.size) @ h2.ravel ()) * .5
         e_test = e0 + e1 + e2 - las2.e_states[0]
         e_ref = las2_e - las2.e_states[0]
         for ix, (test, ref) in enumerate (zip (e_test, e_ref)):